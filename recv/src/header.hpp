@@ -47,14 +47,46 @@ size_t read(std::span<const uint8_t> bytes, size_t index, Range& arr) {
  * file size               : 8B
  * packet size             : 2B
  * sha3-256 hash of file   : 32B
+ *
+ * Segment header packet (version 3) starts with the same fields, but they describe a single segment of the file as if
+ * it was a file of its own. They are followed by:
+ * session id              : 16B
+ * segment index           : 4B
+ * segment count           : 4B
+ * segment offset          : 8B
+ * total file size         : 8B
+ * sha3-256 hash of total  : 32B
+ *
+ * Checkpoint header packet (version 4) is sent periodically in live-tail streams. It starts with the same fields, but
+ * they describe the prefix of the file that was sent so far. They are followed by:
+ * session id              : 16B
+ * final checkpoint flag   : 1B
  */
 struct StreamHeader {
 	static constexpr uint64_t StaticPacketIndex = 0xFFFFFFFFFFFF;
+	static constexpr uint16_t StreamVersion = 2;
+	static constexpr uint16_t SegmentVersion = 3;
+	static constexpr uint16_t CheckpointVersion = 4;
+
 	uint16_t version = 0;
 	uint64_t file_size = 0;
 	uint16_t packet_size = 0;
 	std::array<uint8_t, 32> sha3_256 = {};
 
+	// For non-segmented streams, these fields describe a single segment that spans the entire file.
+	std::array<uint8_t, 16> session_id = {};
+	uint32_t segment_index = 0;
+	uint32_t segment_count = 1;
+	uint64_t segment_offset = 0;
+	uint64_t total_file_size = 0;
+	std::array<uint8_t, 32> total_sha3_256 = {};
+
+	// Checkpoint fields, only meaningful if `checkpoint()`
+	bool final_checkpoint = false;
+
+	bool segmented() const { return version == SegmentVersion; }
+	bool checkpoint() const { return version == CheckpointVersion; }
+
 	static std::expected<StreamHeader, ParseError> fromBytes(std::span<const uint8_t> bytes) {
 		StreamHeader header;
 		size_t i = 0;
@@ -68,7 +100,7 @@ struct StreamHeader {
 		}
 
 		i = read(bytes, i, header.version);
-		if (header.version != 2) {
+		if (header.version < StreamVersion || header.version > CheckpointVersion) {
 			return std::unexpected<ParseError>(std::format("unknown protocol version: {}", header.version));
 		}
 
@@ -76,11 +108,46 @@ struct StreamHeader {
 		i = read(bytes, i, header.packet_size);
 		i = read(bytes, i, header.sha3_256);
 
+		if (!header.segmented()) {
+			header.total_file_size = header.file_size;
+			header.total_sha3_256 = header.sha3_256;
+		}
+
+		if (header.checkpoint()) {
+			uint8_t flag = 0;
+			i = read(bytes, i, header.session_id);
+			i = read(bytes, i, flag);
+			header.final_checkpoint = flag != 0;
+		}
+
+		if (!header.segmented()) return header;
+
+		i = read(bytes, i, header.session_id);
+		i = read(bytes, i, header.segment_index);
+		i = read(bytes, i, header.segment_count);
+		i = read(bytes, i, header.segment_offset);
+		i = read(bytes, i, header.total_file_size);
+		i = read(bytes, i, header.total_sha3_256);
+
+		if (header.segment_index >= header.segment_count) {
+			return std::unexpected<ParseError>(
+				std::format("segment index is {} (segment count is {})", header.segment_index, header.segment_count)
+			);
+		}
+		if (header.segment_offset + header.file_size > header.total_file_size) {
+			return std::unexpected<ParseError>(std::format(
+				"segment at {} of size {} does not fit into a file of size {}",
+				header.segment_offset,
+				header.file_size,
+				header.total_file_size
+			));
+		}
+
 		return header;
 	}
 
 	std::string repr() const {
-		return std::format(
+		std::string result = std::format(
 			"version: {}\n"
 			"file_size: {}\n"
 			"packet_size: {}\n"
@@ -90,5 +157,29 @@ struct StreamHeader {
 			packet_size,
 			::repr(sha3_256)
 		);
+
+		if (checkpoint()) {
+			result += std::format("\nsession_id: {}\nfinal_checkpoint: {}", ::repr(session_id), final_checkpoint);
+		}
+
+		if (segmented()) {
+			result += std::format(
+				"\n"
+				"session_id: {}\n"
+				"segment_index: {}\n"
+				"segment_count: {}\n"
+				"segment_offset: {}\n"
+				"total_file_size: {}\n"
+				"total_sha3_256: {}",
+				::repr(session_id),
+				segment_index,
+				segment_count,
+				segment_offset,
+				total_file_size,
+				::repr(total_sha3_256)
+			);
+		}
+
+		return result;
 	}
 };
@@ -3,11 +3,20 @@
 /// This file is part of the vis-transfer project, distributed under the GNU GPL version 3.
 /// For full terms see https://github.com/bindreams/vis-transfer/blob/master/LICENSE.md
 
+#include <cryptopp/sha3.h>
 #include <fmt/format.h>
 #include <CLI/CLI.hpp>
+#include <algorithm>
+#include <atomic>
+#include <exception>
+#include <functional>
 #include <iostream>
+#include <mutex>
+#include <optional>
 #include <stdexcept>
 #include <thread>
+#include <utility>
+#include <vector>
 #include "ddm.hpp"
 #include "header.hpp"
 #include "memfile.hpp"
@@ -80,6 +89,25 @@ std::string progress(
 	);
 }
 
+std::string tail_progress(
+	ch::steady_clock::time_point start_time,
+	uint64_t iframe,
+	uint64_t nframes,
+	uint64_t ipacket,
+	uint64_t verified_size
+) {
+	auto now = ch::steady_clock::now();
+
+	return std::format(
+		"{}, packet {}, {} bytes verified, {}, {}",
+		frame(iframe, nframes),
+		ipacket,
+		verified_size,
+		fps(iframe, start_time, now),
+		time_remaining(iframe, nframes, start_time, now)
+	);
+}
+
 std::string header_progress(ch::steady_clock::time_point start_time, uint64_t iframe, uint64_t nframes) {
 	auto now = ch::steady_clock::now();
 
@@ -98,7 +126,43 @@ E except(std::format_string<Args...> fmt, Args&&... args) {
 	return E(std::format(fmt, std::forward<Args>(args)...));
 };
 
-void receive(const std::filesystem::path& input, const std::filesystem::path& output, int verbosity) {
+/// Decode a packet from a frame. If decoding fails, log the reason and return nothing.
+template<Decoder F>
+std::optional<std::vector<uint8_t>> read_packet(av::VideoFrame const& frame, F&& read, int verbosity) {
+	auto packet = read_ddm(frame, read);
+	if (!packet) {
+		if (verbosity >= 1) {
+			fmt::print(
+				stderr,
+				"failed to decode frame at layer {}: {}\n",
+				packet.error().first,
+				packet.error().second.what()
+			);
+		}
+		return std::nullopt;
+	}
+	if (verbosity >= 2) fmt::print(stderr, "contents: {}\n", repr(*packet));
+
+	return std::move(*packet);
+}
+
+/// Whether two headers belong to the same transfer, i.e. are segments (or recordings of a segment) of the same file.
+bool same_transfer(const StreamHeader& a, const StreamHeader& b) {
+	if (a.version != b.version || a.session_id != b.session_id) return false;
+	if (a.checkpoint()) return true;  // Size and hash of a live-tail stream are only known at its end
+
+	return a.segment_count == b.segment_count && a.total_file_size == b.total_file_size &&
+		   a.total_sha3_256 == b.total_sha3_256;
+}
+
+/// Decode a single video recording, containing either a whole file or one of its segments, into a file at `output`.
+/// Return the header of the recording. For live-tail streams, the returned header describes the verified prefix.
+StreamHeader decode(
+	const std::filesystem::path& input,
+	const std::filesystem::path& output,
+	int verbosity,
+	const std::function<void(std::string_view)>& log_progress
+) {
 	auto start_time = ch::steady_clock::now();
 
 	// You can use `combine()` function to chain several read methods. The `combine()` function tries all of the
@@ -106,14 +170,6 @@ void receive(const std::filesystem::path& input, const std::filesystem::path& ou
 	// Each method mush satisfy the `Decoder` concept.
 	auto read = readers::zxing::read;
 
-	auto log_progress = [verbosity](std::string_view str) {
-		if (verbosity > 0) {
-			fmt::print("{}\n", str);
-		} else {
-			fmt::print("\r{}", str);
-		}
-	};
-
 	// Video reader thread ---------------------------------------------------------------------------------------------
 	VideoStream stream{input};
 	uint64_t iframe = 0;
@@ -157,19 +213,8 @@ void receive(const std::filesystem::path& input, const std::filesystem::path& ou
 		log_progress(report::header_progress(start_time, iframe, nframes));
 		av::VideoFrame frame = read_frame();
 
-		auto packet = read_ddm(frame, read);
-		if (!packet) {
-			if (verbosity >= 1) {
-				fmt::print(
-					stderr,
-					"failed to decode frame at layer {}: {}\n",
-					packet.error().first,
-					packet.error().second.what()
-				);
-			}
-			continue;
-		}
-		if (verbosity >= 2) fmt::print(stderr, "contents: {}\n", repr(*packet));
+		auto packet = read_packet(frame, read, verbosity);
+		if (!packet) continue;
 
 		if (packet_index(*packet) != StreamHeader::StaticPacketIndex) {
 			throw except("failed to find a header: found packet {}", packet_index(*packet));
@@ -181,6 +226,131 @@ void receive(const std::filesystem::path& input, const std::filesystem::path& ou
 
 	if (verbosity >= 1) fmt::print(stderr, "found header:\n{}\n", repr(1, header));
 
+	if (header.checkpoint()) {
+		// Live-tail stream. File size is not known in advance, instead data packets are interleaved with checkpoints,
+		// each of which verifies the prefix of the file received so far.
+		memfile mf(output, 0);
+		CryptoPP::SHA3_256 hasher;  // Hash of the received prefix
+		uint64_t metadata_size = PacketIndexSize;
+		uint64_t received_size = 0;
+		uint64_t verified_size = 0;
+		uint64_t ipacket_next = 0;
+		bool short_packet_received = false;
+
+		// Any error after the header ends the stream early: data verified up to that point is still returned, and is
+		// reported by the caller as incomplete.
+		std::string interruption = "reached end of file";
+		while (true) {
+			if (iframe >= nframes) break;
+			log_progress(report::tail_progress(start_time, iframe, nframes, ipacket_next, verified_size));
+
+			auto packet = read_packet(read_frame(), read, verbosity);
+			if (!packet) continue;
+
+			uint64_t ipacket = packet_index(*packet);
+
+			if (ipacket == StreamHeader::StaticPacketIndex) {
+				std::optional<StreamHeader> checkpoint;
+				try {
+					checkpoint = unwrap(StreamHeader::fromBytes(*packet));
+				} catch (const std::exception& e) {
+					interruption = std::format("checkpoint corrupted: {}", e.what());
+					break;
+				}
+				if (!checkpoint->checkpoint() || checkpoint->session_id != header.session_id) {
+					interruption = std::format(
+						"checkpoint belongs to a different transfer (session id {})", repr(checkpoint->session_id)
+					);
+					break;
+				}
+				if (checkpoint->file_size < received_size) {
+					// Already verified, or this checkpoint was missed and data after it was received
+					if (verbosity >= 1) fmt::print(stderr, "skipping checkpoint at {} bytes\n", checkpoint->file_size);
+					continue;
+				}
+				if (checkpoint->file_size > received_size) {
+					interruption = std::format(
+						"failed to find packet {}: found checkpoint at {} bytes ({} bytes received)",
+						ipacket_next,
+						checkpoint->file_size,
+						received_size
+					);
+					break;
+				}
+
+				CryptoPP::SHA3_256 prefix_hasher = hasher;
+				std::array<uint8_t, 32> sha3_256;
+				prefix_hasher.Final(sha3_256.data());
+
+				if (sha3_256 != checkpoint->sha3_256) {
+					interruption = std::format(
+						"file corrupted, hash of the first {} bytes is incorrect:\nexpected {}\n     got {}",
+						checkpoint->file_size,
+						repr(checkpoint->sha3_256),
+						repr(sha3_256)
+					);
+					break;
+				}
+
+				verified_size = received_size;
+				header.sha3_256 = checkpoint->sha3_256;
+				if (checkpoint->final_checkpoint) {
+					header.final_checkpoint = true;
+					break;
+				}
+				continue;
+			}
+
+			if (ipacket < ipacket_next) {
+				if (verbosity >= 1) fmt::print(stderr, "packet already decoded\n");
+				continue;
+			}
+			if (ipacket > ipacket_next) {
+				interruption = std::format("failed to find packet {}: found packet {} instead", ipacket_next, ipacket);
+				break;
+			}
+			if (short_packet_received) {
+				interruption = std::format(
+					"packet {} corrupted: only the last packet can be shorter than packet size", ipacket_next - 1
+				);
+				break;
+			}
+			if (packet->size() <= metadata_size || packet->size() > header.packet_size) {
+				interruption = std::format(
+					"packet {} corrupted: size is {} (packet size is {})", ipacket, packet->size(), header.packet_size
+				);
+				break;
+			}
+			short_packet_received = packet->size() < header.packet_size;
+
+			std::span<const uint8_t> block{packet->data() + metadata_size, packet->size() - metadata_size};
+			if (received_size + block.size() > mf.size()) {
+				mf.resize(std::max<uint64_t>(received_size + block.size(), 2 * mf.size()));
+			}
+			mf.write(received_size, block);
+			hasher.Update(block.data(), block.size());
+
+			received_size += block.size();
+			++ipacket_next;
+		}
+
+		if (!header.final_checkpoint) {
+			fmt::print(
+				stderr,
+				"\n{}: stream interrupted after {} verified bytes: {}\n",
+				input.string(),
+				verified_size,
+				interruption
+			);
+		}
+
+		mf.resize(verified_size);
+		mf.close();
+		header.file_size = header.total_file_size = verified_size;
+		log_progress(report::tail_progress(start_time, iframe, nframes, ipacket_next, verified_size));
+		return header;
+	}
+
 	uint64_t metadata_size = PacketIndexSize;
 	uint64_t block_size = header.packet_size - metadata_size;
 	uint64_t npackets = static_cast<uint64_t>(std::ceil(double(header.file_size) / block_size));
@@ -198,29 +368,15 @@ void receive(const std::filesystem::path& input, const std::filesystem::path& ou
 			npackets
 		);
 
-	std::filesystem::path output_temp = output;
-	output_temp += ".vis-transfer-incomplete";
-	ScopeGuard remove_output_temp([&] { std::filesystem::remove(output_temp); });
-	memfile mf(output_temp, header.file_size);
+	memfile mf(output, header.file_size);
 
 	while (iframe < nframes) {
 		if (iframe >= nframes) throw except("failed to find packet {}: reached end of file", ipacket_next);
 		log_progress(report::progress(start_time, iframe, nframes, ipacket_next, npackets));
 		av::VideoFrame frame = read_frame();
 
-		auto packet = read_ddm(frame, read);
-		if (!packet) {
-			if (verbosity >= 1) {
-				fmt::print(
-					stderr,
-					"failed to decode frame at layer {}: {}\n",
-					packet.error().first,
-					packet.error().second.what()
-				);
-			}
-			continue;
-		}
-		if (verbosity >= 2) fmt::print(stderr, "contents: {}\n", repr(*packet));
+		auto packet = read_packet(frame, read, verbosity);
+		if (!packet) continue;
 
 		uint64_t ipacket = packet_index(*packet);
 
@@ -249,17 +405,168 @@ void receive(const std::filesystem::path& input, const std::filesystem::path& ou
 		++ipacket_next;
 	}
 
-	if (mf.sha3_256() != header.sha3_256) {
+	auto sha3_256 = mf.sha3_256();
+	if (sha3_256 != header.sha3_256) {
 		throw except(
-			"file corrupted, hash is incorrect:\nexpected {}\n     got {}", repr(header.sha3_256), repr(mf.sha3_256())
+			"{} corrupted, hash is incorrect:\nexpected {}\n     got {}",
+			header.segmented() ? std::format("segment {}", header.segment_index) : "file",
+			repr(header.sha3_256),
+			repr(sha3_256)
 		);
 	}
 
 	mf.close();
 	log_progress(report::progress(start_time, iframe, nframes, npackets, npackets));
-	std::filesystem::rename(output_temp, output);
+	return header;
+}
+
+void receive(const std::vector<std::filesystem::path>& inputs, const std::filesystem::path& output, int verbosity) {
+	std::mutex log_mutex;
+	auto log_progress = [&](size_t iinput, std::string_view str) {
+		std::lock_guard lock{log_mutex};
+		std::string prefix = inputs.size() > 1 ? std::format("[{}] ", inputs[iinput].filename().string()) : "";
+
+		if (verbosity > 0) {
+			fmt::print("{}{}\n", prefix, str);
+		} else {
+			fmt::print("\r{}{}", prefix, str);
+		}
+	};
+
+	std::filesystem::path output_temp = output;
+	output_temp += ".vis-transfer-incomplete";
+	ScopeGuard remove_output_temp([&] { std::filesystem::remove(output_temp); });
+
+	// Each input is first decoded into its own temporary file and verified, so that a bad recording cannot corrupt data
+	// decoded from a good one. Inputs may contain different segments of the same file, or the same segment recorded
+	// several times, in which case it's enough for one of the recordings to be decoded successfully.
+	auto input_temp = [&](size_t i) {
+		std::filesystem::path result = output_temp;
+		result += std::format(".{}", i);
+		return result;
+	};
+	ScopeGuard remove_input_temps([&] {
+		for (size_t i = 0; i < inputs.size(); ++i) std::filesystem::remove(input_temp(i));
+	});
+
+	std::vector<std::optional<StreamHeader>> headers(inputs.size());
+	std::vector<std::exception_ptr> errors(inputs.size());
+	{
+		size_t nthreads = std::clamp<size_t>(std::thread::hardware_concurrency(), 1, inputs.size());
+		std::atomic<size_t> inext = 0;
+
+		std::vector<std::jthread> threads;
+		for (size_t ithread = 0; ithread < nthreads; ++ithread) {
+			threads.emplace_back([&] {
+				for (size_t i = inext++; i < inputs.size(); i = inext++) {
+					try {
+						headers[i] = decode(inputs[i], input_temp(i), verbosity, [&](std::string_view str) {
+							log_progress(i, str);
+						});
+					} catch (...) {
+						errors[i] = std::current_exception();
+					}
+				}
+			});
+		}
+	}
 
 	if (verbosity == 0) fmt::print("\n");
+	if (inputs.size() == 1 && errors[0]) std::rethrow_exception(errors[0]);
+
+	// The transfer the majority of inputs belong to is the one being assembled. Ties go to the earliest input.
+	std::optional<size_t> ireference;
+	size_t reference_count = 0;
+	for (size_t i = 0; i < inputs.size(); ++i) {
+		if (!headers[i]) continue;
+
+		size_t count = 0;
+		for (size_t j = 0; j < inputs.size(); ++j) {
+			if (headers[j] && same_transfer(*headers[i], *headers[j])) ++count;
+		}
+		if (count > reference_count) {
+			ireference = i;
+			reference_count = count;
+		}
+	}
+
+	for (size_t i = 0; i < inputs.size(); ++i) {
+		if (ireference && headers[i] && !same_transfer(*headers[i], *headers[*ireference])) {
+			errors[i] = std::make_exception_ptr(
+				except("input belongs to a different transfer (session id {})", repr(headers[i]->session_id))
+			);
+			headers[i].reset();
+		}
+		if (!errors[i]) continue;
+
+		try {
+			std::rethrow_exception(errors[i]);
+		} catch (const std::exception& e) {
+			fmt::print(stderr, "failed to decode {}: {}\n", inputs[i].string(), e.what());
+		}
+	}
+
+	if (!ireference) throw except("failed to decode any of the inputs");
+	const StreamHeader header = *headers[*ireference];
+
+	// Pick one decoded recording for every segment. Live-tail recordings may be cut off at different points, in which
+	// case the most complete one is picked.
+	auto more_complete = [](const StreamHeader& a, const StreamHeader& b) {
+		return std::pair{a.final_checkpoint, a.file_size} > std::pair{b.final_checkpoint, b.file_size};
+	};
+	std::vector<std::optional<size_t>> sources(header.segment_count);
+	for (size_t i = 0; i < inputs.size(); ++i) {
+		if (!headers[i]) continue;
+
+		auto& source = sources[headers[i]->segment_index];
+		if (!source || more_complete(*headers[i], *headers[*source])) source = i;
+	}
+
+	std::string missing;
+	size_t nmissing = 0;
+	for (uint32_t isegment = 0; isegment < header.segment_count; ++isegment) {
+		if (sources[isegment]) continue;
+		if (!missing.empty()) missing += ", ";
+		missing += std::to_string(isegment);
+		++nmissing;
+	}
+	if (nmissing != 0) throw except("missing {} of {} segments: {}", nmissing, header.segment_count, missing);
+
+	if (header.checkpoint() && !headers[*sources[0]]->final_checkpoint) {
+		// Keep the verified prefix under the incomplete name, so it can't be mistaken for a successful transfer
+		std::filesystem::rename(input_temp(*sources[0]), output_temp);
+		remove_output_temp.release();
+		throw except(
+			"stream ended before the final checkpoint: the first {} verified bytes were saved to {}",
+			headers[*sources[0]]->file_size,
+			output_temp.string()
+		);
+	}
+
+	if (!header.segmented()) {
+		std::filesystem::rename(input_temp(*sources[0]), output);
+		fmt::print(stderr, "done\n");
+		return;
+	}
+
+	memfile mf(output_temp, header.total_file_size);
+	for (const auto& source : sources) {
+		size_t i = *source;
+		memfile segment(input_temp(i), headers[i]->file_size);
+		mf.write(headers[i]->segment_offset, segment.data());
+		segment.close();
+	}
+
+	auto sha3_256 = mf.sha3_256();
+	if (sha3_256 != header.total_sha3_256) {
+		throw except(
+			"file corrupted, hash is incorrect:\nexpected {}\n     got {}", repr(header.total_sha3_256), repr(sha3_256)
+		);
+	}
+
+	mf.close();
+	std::filesystem::rename(output_temp, output);
+
 	fmt::print(stderr, "done\n");
 }
 
@@ -267,11 +574,11 @@ int main(int argc, char** argv) {
 	CLI::App app{"Visual file transfer decoder.", "vis-recv"};
 	app.set_version_flag("-V,--version", "1.0.0");
 
-	std::filesystem::path input;
+	std::vector<std::filesystem::path> inputs;
 	std::filesystem::path output;
 	bool force = false;
 	// clang-format off
-	app.add_option("input", input, "Input video recording")
+	app.add_option("input", inputs, "Input video recordings, one or more per segment if the file was segmented")
 		->required()
 		->check(CLI::ExistingFile);
 	app.add_option("-o,--output", output, "Output file")
@@ -297,7 +604,7 @@ int main(int argc, char** argv) {
 	if (verbosity >= 2) VideoStream::set_verbose(true);
 
 	try {
-		receive(input, output, verbosity);
+		receive(inputs, output, verbosity);
 	} catch (const std::exception& e) {
 		std::cout << "\n" << typeid(e).name() << ": " << e.what() << "\n";
 		return 1;
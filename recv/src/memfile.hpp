@@ -18,10 +18,18 @@ struct memfile {
 		handle.truncate(size).value();
 	}
 
+	size_t size() const { return handle.maximum_extent().value(); }
+
+	void resize(size_t new_size) { handle.truncate(new_size).value(); }
+
 	void write(size_t offset, std::span<const uint8_t> bytes) {
 		handle.write(offset, {{reinterpret_cast<const std::byte*>(bytes.data()), bytes.size()}});
 	}
 
+	std::span<const uint8_t> data() const {
+		return {reinterpret_cast<const uint8_t*>(handle.address()), handle.maximum_extent().value()};
+	}
+
 	std::array<uint8_t, 32> sha3_256() const {
 		CryptoPP::SHA3_256 hasher;
 		hasher.Update(reinterpret_cast<const CryptoPP::byte*>(handle.address()), handle.maximum_extent().value());
@@ -1,9 +1,58 @@
 import sys
 import argparse
+from pathlib import Path
 
-from PySide6.QtWidgets import QApplication
+from .daemon import Daemon, DaemonError, DefaultFrameCacheSize, DefaultIdleTimeout, request
+
+
+def positive_int(value):
+    result = int(value)
+    if result < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1 (got {value})")
+    return result
+
+
+def non_negative_float(value):
+    result = float(value)
+    if result < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative (got {value})")
+    return result
+
+
+def add_generate_options(parser):
+    generate_mode = parser.add_mutually_exclusive_group()
+    generate_mode.add_argument(
+        "--segment-size",
+        type=positive_int,
+        help="split the file into segments of this many bytes, each written to its own video file",
+    )
+    generate_mode.add_argument(
+        "--tail",
+        action="store_true",
+        help="stream a file that is still being written, until it stops growing (see --idle-timeout)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=non_negative_float,
+        default=DefaultIdleTimeout,
+        help="in tail mode, seconds without growth before the stream ends",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=non_negative_float,
+        default=0.5,
+        help="in tail mode, seconds between checks for new data",
+    )
+    parser.add_argument(
+        "--batch-size", type=positive_int, default=1, help="in tail mode, minimum number of new blocks to send at once"
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=positive_int,
+        default=64,
+        help="in tail mode, number of packets between checkpoints",
+    )
 
-from .interface import SetupWindow
 
 def cli():
     parser = argparse.ArgumentParser()
@@ -12,17 +61,118 @@ def cli():
     generate_parser = subparsers.add_parser("generate")
     generate_parser.add_argument("input", type=argparse.FileType("rb"))
     generate_parser.add_argument("-o", "--output", required=True)
+    add_generate_options(generate_parser)
+
+    daemon_parser = subparsers.add_parser("daemon", help="run a local encoding daemon for batches of generate jobs")
+    daemon_parser.add_argument("--socket", help="path of the Unix socket to listen on")
+    daemon_parser.add_argument(
+        "--workers", type=positive_int, help="number of worker processes (default: number of cores)"
+    )
+    daemon_parser.add_argument(
+        "--frame-cache-size",
+        type=int,
+        default=DefaultFrameCacheSize,
+        help="number of rendered frames cached by each worker",
+    )
+
+    submit_parser = subparsers.add_parser("submit", help="submit a generate job to the daemon")
+    submit_parser.add_argument("input", type=Path)
+    submit_parser.add_argument("-o", "--output", type=Path, required=True)
+    submit_parser.add_argument("--priority", type=int, default=0, help="jobs with higher priority are started first")
+    submit_parser.add_argument("--wait", action="store_true", help="report progress until the job is finished")
+    submit_parser.add_argument("--socket", help="path of the daemon's Unix socket")
+    add_generate_options(submit_parser)
+
+    status_parser = subparsers.add_parser("status", help="show the state of daemon jobs")
+    status_parser.add_argument("job", type=int, nargs="?")
+    status_parser.add_argument("--wait", action="store_true", help="report progress until the job is finished")
+    status_parser.add_argument("--socket", help="path of the daemon's Unix socket")
+
+    shutdown_parser = subparsers.add_parser(
+        "shutdown", help="stop the daemon: running jobs are finished, queued jobs are cancelled"
+    )
+    shutdown_parser.add_argument("--socket", help="path of the daemon's Unix socket")
 
     return parser
 
 
+def print_job(job):
+    total = job["total"] if job["total"] is not None else "-"
+    line = f"job {job['id']}: {job['state']}, {job['done']}/{total} frames, {job['input']}"
+    if job["error"] is not None:
+        line += f"\n  {job['error']}"
+    print(line, flush=True)
+
+
+def client(args):
+    if args.subcommand == "submit":
+        message = {
+            "command": "submit",
+            "input": str(args.input.resolve()),
+            "output": str(args.output.resolve()),
+            "priority": args.priority,
+            "wait": args.wait,
+            "options": {
+                "segment_size": args.segment_size,
+                "tail": args.tail,
+                "idle_timeout": args.idle_timeout,
+                "poll_interval": args.poll_interval,
+                "batch_size": args.batch_size,
+                "checkpoint_interval": args.checkpoint_interval,
+            },
+        }
+    elif args.subcommand == "status":
+        message = {"command": "wait" if args.wait else "status", "job": args.job}
+    else:
+        message = {"command": args.subcommand}
+
+    failed = False
+    for response in request(message, socket_path=args.socket):
+        for job in response.get("jobs", [response["job"]] if "job" in response else []):
+            print_job(job)
+            failed = failed or job["state"] in ("failed", "cancelled")
+
+    return 1 if failed else 0
+
+
 def main():
     args = cli().parse_args()
     if args.subcommand == "generate":
-        from .testing import generate_video
+        if args.segment_size is not None:
+            from .video import generate_segmented_videos
+            generate_segmented_videos(args.input, output_path=args.output, segment_size=args.segment_size)
+            return
+
+        if args.tail:
+            from .video import generate_tail_video
+            generate_tail_video(
+                args.input,
+                output_path=args.output,
+                idle_timeout=args.idle_timeout,
+                poll_interval=args.poll_interval,
+                batch_size=args.batch_size,
+                checkpoint_interval=args.checkpoint_interval,
+            )
+            return
+
+        from .video import generate_video
         generate_video(args.input, output_path=args.output)
         return
 
+    if args.subcommand in ("daemon", "submit", "status", "shutdown"):
+        try:
+            if args.subcommand == "daemon":
+                return Daemon(workers=args.workers, frame_cache_size=args.frame_cache_size).serve(args.socket)
+            return client(args)
+        except DaemonError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+
+    # Imported here so that the command-line subcommands don't pay for loading Qt
+    from PySide6.QtWidgets import QApplication
+
+    from .interface import SetupWindow
+
     app = QApplication([])
     setup = SetupWindow()
 
@@ -46,6 +46,8 @@ dminfo = {
 
 DatamatrixWidth = 96
 ProtocolVersion = 2
+SegmentProtocolVersion = 3
+CheckpointProtocolVersion = 4
 LayerSize = dminfo[DatamatrixWidth].eci_bytes
 PacketSize = LayerSize * 3
 BlockSize = PacketSize - 6  # -6 for the block index at the beginning
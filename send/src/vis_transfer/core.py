@@ -4,6 +4,9 @@ import itertools
 import math
 import os
 import struct
+import threading
+import time
+import uuid
 from dataclasses import dataclass
 from typing import BinaryIO
 
@@ -62,24 +65,63 @@ def ddm_stream_header(fd: BinaryIO, /, *, symbol_size: int) -> Image:
     return dense_datamatrix(packet, symbol_size=symbol_size)
 
 
-def packet_stream(fd: BinaryIO, /, *, packet_size: int):
-    """Given a binary stream `f`, yield sequential packets to be encoded and sent."""
+def ddm_segment_stream(fd: BinaryIO, stream_info: "SegmentedStreamInfo", segment_index: int, /, *, symbol_size: int):
+    """Given a seekable stream, yield sequential dense datamatrix encodings of one segment of the file."""
+    packet_size = dminfo[symbol_size].eci_bytes * 3
+    for packet in segment_packet_stream(fd, stream_info.segments[segment_index], packet_size=packet_size):
+        yield dense_datamatrix(packet, symbol_size=symbol_size)
+
+
+def ddm_segment_header(stream_info: "SegmentedStreamInfo", segment_index: int, /, *, symbol_size: int) -> Image:
+    """Produce a header dense datamatrix for one segment of a segmented stream."""
+    packet_size = dminfo[symbol_size].eci_bytes * 3
+    packet = segment_header(stream_info, segment_index, packet_size=packet_size)
+    return dense_datamatrix(packet, symbol_size=symbol_size)
+
+
+def ddm_tail_stream(fd: BinaryIO, /, *, symbol_size: int, **kwargs):
+    """Given a seekable stream that may still be growing, yield sequential dense datamatrix encodings of the file.
+
+    The first image is a checkpoint header. Keyword arguments are forwarded to `tail_packet_stream`.
+    """
+    packet_size = dminfo[symbol_size].eci_bytes * 3
+    for packet in tail_packet_stream(fd, packet_size=packet_size, **kwargs):
+        yield dense_datamatrix(packet, symbol_size=symbol_size)
+
+
+def packet_stream(fd: BinaryIO, /, *, packet_size: int, length: int | None = None):
+    """Given a binary stream `f`, yield sequential packets to be encoded and sent.
+
+    If `length` is specified, at most `length` bytes are read from the stream.
+    """
     # A block is a section of the payload that fits into one packet.
     # Its size is the packet size minus 6 bytes for the index.
     block_size = packet_size - 6
+    remaining = length
 
     for i in itertools.count():
         if i >= constants.HeaderPacketIndex:
             raise ValueError("stream is too big; index has overflown")
 
-        block = fd.read(block_size)
+        block = fd.read(block_size if remaining is None else min(block_size, remaining))
         assert block is not None
         if len(block) == 0:
             break
+        if remaining is not None:
+            remaining -= len(block)
 
         yield makepacket(i, block, packet_size=packet_size)
 
 
+def segment_packet_stream(fd: BinaryIO, segment: "SegmentInfo", /, *, packet_size: int):
+    """Given a seekable stream, yield sequential packets of one segment.
+
+    Packet indices start from 0 in every segment.
+    """
+    fd.seek(segment.offset, os.SEEK_SET)
+    yield from packet_stream(fd, packet_size=packet_size, length=segment.length)
+
+
 @dataclass
 class PacketStreamInfo:
     file_size: int
@@ -128,6 +170,226 @@ def packet_stream_info(fd: BinaryIO):
     return PacketStreamInfo(size, sha3_256)
 
 
+@dataclass
+class SegmentInfo:
+    index: int
+    offset: int
+    length: int
+    sha3_256: bytes
+
+
+@dataclass
+class SegmentedStreamInfo:
+    session_id: bytes
+    file_info: PacketStreamInfo
+    segments: list[SegmentInfo]
+
+
+def segmented_stream_info(fd: BinaryIO, /, *, segment_size: int, session_id: bytes | None = None):
+    """Retrieve information about the file and each of its segments, necessary to assemble segment headers.
+
+    If `session_id` is not specified, a random one is generated. All segments of the file share the session id, which
+    lets the receiver tell them apart from segments of other transfers.
+    """
+    if segment_size <= 0:
+        raise ValueError(f"segment size must be positive (got {segment_size})")
+    if session_id is None:
+        session_id = uuid.uuid4().bytes
+    if len(session_id) != 16:
+        raise ValueError(f"session id must be 16 bytes long (got {len(session_id)})")
+
+    old_pos = fd.tell()
+
+    try:
+        fd.seek(0, os.SEEK_SET)
+    except OSError as e:
+        raise ValueError("provided stream is not seekable") from e
+
+    hasher = hashlib.sha3_256()
+    segments = []
+    offset = 0
+    while True:
+        segment_hasher = hashlib.sha3_256()
+        length = 0
+        while length < segment_size:
+            section = fd.read(min(65536, segment_size - length))
+            assert section is not None
+            if len(section) == 0:
+                break
+            hasher.update(section)
+            segment_hasher.update(section)
+            length += len(section)
+
+        # An empty file still consists of one (empty) segment
+        if length == 0 and len(segments) != 0:
+            break
+
+        segments.append(SegmentInfo(len(segments), offset, length, segment_hasher.digest()))
+        offset += length
+        if length < segment_size:
+            break
+
+    fd.seek(old_pos, os.SEEK_SET)
+    return SegmentedStreamInfo(session_id, PacketStreamInfo(offset, hasher.digest()), segments)
+
+
+def segment_header(stream_info: SegmentedStreamInfo, segment_index: int, /, *, packet_size: int):
+    """Produce a header packet for one segment of a segmented stream.
+
+    The segment header starts with the same fields as a regular header, describing the segment as if it was a file of
+    its own, so that each segment can be verified independently. The fields that follow describe the whole file.
+    """
+    segment = stream_info.segments[segment_index]
+
+    block = struct.pack(
+        ">HQH32s16sIIQQ32s",
+        constants.SegmentProtocolVersion,  # protocol version
+        segment.length,  # segment size
+        packet_size,  # packet size
+        segment.sha3_256,  # sha3-256 of segment
+        stream_info.session_id,  # session id
+        segment.index,  # segment index
+        len(stream_info.segments),  # segment count
+        segment.offset,  # segment offset in file
+        stream_info.file_info.file_size,  # file size
+        stream_info.file_info.sha3_256,  # sha3-256 of file
+    )
+
+    return makepacket(index=constants.HeaderPacketIndex, block=block, packet_size=packet_size)
+
+
+def checkpoint_header(session_id: bytes, length: int, sha3_256: bytes, /, *, packet_size: int, final: bool):
+    """Produce a checkpoint header packet for a live-tail stream.
+
+    A checkpoint starts with the same fields as a regular header, describing the prefix of the file that was sent so
+    far. It is followed by the session id and a flag marking the last checkpoint of the stream.
+    """
+    block = struct.pack(
+        ">HQH32s16s?",
+        constants.CheckpointProtocolVersion,  # protocol version
+        length,  # length of the prefix sent so far
+        packet_size,  # packet size
+        sha3_256,  # sha3-256 of the prefix
+        session_id,  # session id
+        final,  # whether this is the last checkpoint
+    )
+
+    return makepacket(index=constants.HeaderPacketIndex, block=block, packet_size=packet_size)
+
+
+def tail_packet_stream(
+    fd: BinaryIO,
+    /,
+    *,
+    packet_size: int,
+    session_id: bytes | None = None,
+    poll_interval: float = 0.5,
+    batch_size: int = 1,
+    checkpoint_interval: int = 64,
+    idle_timeout: float | None = None,
+    stop: threading.Event | None = None,
+):
+    """Given a seekable stream that may still be growing, yield packets as new data appears.
+
+    The stream is polled for new data every `poll_interval` seconds. Data is only packed once at least `batch_size`
+    complete blocks are available, so that a slowly growing file does not produce a packet for every write. A checkpoint
+    header packet is produced first, then after every `checkpoint_interval` data packets, and whenever the stream
+    catches up with the end of the file.
+
+    The stream ends when the file has not grown for `idle_timeout` seconds, or when `stop` is set. At that point the
+    rest of the file (including an incomplete block) is sent, followed by a final checkpoint.
+    """
+    if session_id is None:
+        session_id = uuid.uuid4().bytes
+    if len(session_id) != 16:
+        raise ValueError(f"session id must be 16 bytes long (got {len(session_id)})")
+    if batch_size < 1:
+        raise ValueError(f"batch size must be at least 1 (got {batch_size})")
+    if checkpoint_interval < 1:
+        raise ValueError(f"checkpoint interval must be at least 1 (got {checkpoint_interval})")
+    if poll_interval < 0:
+        raise ValueError(f"poll interval must not be negative (got {poll_interval})")
+    if idle_timeout is not None and idle_timeout < 0:
+        raise ValueError(f"idle timeout must not be negative (got {idle_timeout})")
+
+    block_size = packet_size - 6
+    hasher = hashlib.sha3_256()
+    position = 0
+    index = 0
+    checkpointed = 0  # index of the first packet not covered by a checkpoint
+
+    def checkpoint(final=False):
+        nonlocal checkpointed
+        checkpointed = index
+        return checkpoint_header(session_id, position, hasher.copy().digest(), packet_size=packet_size, final=final)
+
+    def send(length):
+        nonlocal position, index
+        fd.seek(position, os.SEEK_SET)
+
+        while length > 0:
+            if index >= constants.HeaderPacketIndex:
+                raise ValueError("stream is too big; index has overflown")
+
+            block = fd.read(min(block_size, length))
+            assert block is not None
+            if len(block) == 0:
+                raise ValueError("stream ended before the expected amount of data could be read")
+
+            hasher.update(block)
+            position += len(block)
+            length -= len(block)
+            index += 1
+
+            yield makepacket(index - 1, block, packet_size=packet_size)
+            if index - checkpointed >= checkpoint_interval:
+                yield checkpoint()
+
+    yield checkpoint()
+    last_size = 0
+    last_growth = time.monotonic()
+
+    while True:
+        size = _stream_size(fd)
+        if size < position:
+            raise ValueError(f"stream was truncated to {size}B while being sent ({position}B already sent)")
+        if size != last_size:
+            last_size = size
+            last_growth = time.monotonic()
+
+        available_blocks = (size - position) // block_size
+        if available_blocks >= batch_size:
+            yield from send(available_blocks * block_size)
+            continue
+
+        if (stop is not None and stop.is_set()) or (
+            idle_timeout is not None and time.monotonic() - last_growth >= idle_timeout
+        ):
+            yield from send(size - position)
+            yield checkpoint(final=True)
+            return
+
+        if index != checkpointed:
+            yield checkpoint()
+
+        if stop is not None:
+            stop.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+
+
+def _stream_size(fd: BinaryIO):
+    old_pos = fd.tell()
+
+    try:
+        size = fd.seek(0, os.SEEK_END)
+    except OSError as e:
+        raise ValueError("provided stream is not seekable") from e
+
+    fd.seek(old_pos, os.SEEK_SET)
+    return size
+
+
 def packet_count(file_info_or_fd: BinaryIO | PacketStreamInfo):
     if not isinstance(file_info_or_fd, PacketStreamInfo):
         file_info = packet_stream_info(file_info_or_fd)
@@ -0,0 +1,360 @@
+"""Persistent local encoding daemon and its client.
+
+The daemon keeps a pool of warm worker processes (with the encoder and video libraries already imported and
+initialised) and accepts `generate` jobs over a Unix socket. Jobs are started in order of priority. Each worker keeps
+caches of stream information and rendered frames, so repeated jobs for the same file skip hashing and encoding.
+
+The protocol is a sequence of JSON objects, one per line. The client sends a single request, and the daemon responds
+with one or more messages, then closes the connection.
+
+Only the standard library is imported at module level, so that the client stays fast to start.
+"""
+
+import functools
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+
+ProgressInterval = 32
+"""Number of frames between progress reports sent by workers."""
+
+DefaultFrameCacheSize = 4096
+"""Default number of rendered frames cached by each worker."""
+
+DefaultIdleTimeout = 10
+"""Default number of seconds without growth after which a tail job ends. Tail jobs always time out."""
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    return Path(runtime_dir) / f"vis-transfer-{user}.sock"
+
+
+class DaemonError(Exception):
+    """An error reported by the daemon in response to a request."""
+
+
+# Worker ===============================================================================================================
+_progress_queue = None
+_render = None
+
+
+def _init_worker(progress_queue, frame_cache_size):
+    """Initialise a worker process: import and warm up the encoder, set up caches."""
+    global _progress_queue, _render  # pylint: disable=global-statement
+
+    from . import constants
+    from . import video  # pylint: disable=unused-import  # Imports av
+    from .core import checkpoint_header, dense_datamatrix
+
+    _progress_queue = progress_queue
+    _render = functools.lru_cache(maxsize=frame_cache_size)(
+        functools.partial(dense_datamatrix, symbol_size=constants.DatamatrixWidth)
+    )
+
+    # Initialise zint by rendering a real packet (zint rejects empty data)
+    dense_datamatrix(
+        checkpoint_header(bytes(16), 0, bytes(32), packet_size=constants.PacketSize, final=True),
+        symbol_size=constants.DatamatrixWidth,
+    )
+
+
+def _ping():
+    return os.getpid()
+
+
+@functools.lru_cache(maxsize=256)
+def _stream_info(path, size, mtime_ns):  # pylint: disable=unused-argument  # size and mtime are part of the cache key
+    from .core import packet_stream_info
+
+    with open(path, "rb") as fd:
+        return packet_stream_info(fd)
+
+
+@functools.lru_cache(maxsize=256)
+def _segmented_stream_info(path, size, mtime_ns, segment_size):  # pylint: disable=unused-argument
+    from .core import segmented_stream_info
+
+    with open(path, "rb") as fd:
+        return segmented_stream_info(fd, segment_size=segment_size)
+
+
+def _run_job(job_id, input_path, output_path, options):
+    """Execute a `generate` job in a worker process. Return a list of produced video files."""
+    from .video import generate_segmented_videos, generate_tail_video, generate_video
+
+    def progress(done, total):
+        if done % ProgressInterval == 0 or done == total:
+            _progress_queue.put((job_id, done, total))
+
+    stat = os.stat(input_path)
+
+    with open(input_path, "rb") as fd:
+        if options.get("tail"):
+            tail_options = {
+                k: options[k]
+                for k in ("poll_interval", "batch_size", "checkpoint_interval")
+                if options.get(k) is not None
+            }
+            tail_options["idle_timeout"] = options.get("idle_timeout") or DefaultIdleTimeout
+            generate_tail_video(fd, output_path=output_path, render=_render, progress=progress, **tail_options)
+            return [str(output_path)]
+
+        if options.get("segment_size") is not None:
+            stream_info = _segmented_stream_info(input_path, stat.st_size, stat.st_mtime_ns, options["segment_size"])
+            paths = generate_segmented_videos(
+                fd,
+                output_path=output_path,
+                stream_info=replace(stream_info, session_id=uuid.uuid4().bytes),
+                render=_render,
+                progress=progress,
+            )
+            return [str(path) for path in paths]
+
+        file_info = _stream_info(input_path, stat.st_size, stat.st_mtime_ns)
+        generate_video(fd, output_path=output_path, file_info=file_info, render=_render, progress=progress)
+        return [str(output_path)]
+
+
+# Daemon ===============================================================================================================
+@dataclass
+class Job:
+    id: int
+    input: str
+    output: str
+    options: dict
+    priority: int = 0
+    state: str = "queued"  # queued, running, done, failed, cancelled
+    started: float | None = None  # time.time() when the job started running
+    done: int = 0  # frames rendered
+    total: int | None = None  # total frames, if known
+    outputs: list[str] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+
+class Daemon:
+    """Job queue and a pool of warm encoder processes.
+
+    Jobs with a higher priority are started first; jobs with the same priority are started in order of submission. Each
+    worker process runs one job at a time. When the daemon is stopped, running jobs are finished and queued jobs are
+    cancelled.
+    """
+
+    def __init__(self, *, workers: int | None = None, frame_cache_size: int = DefaultFrameCacheSize):
+        if not hasattr(socket, "AF_UNIX"):
+            raise DaemonError("daemon requires Unix sockets")
+
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+
+        self._jobs: dict[int, Job] = {}
+        self._queue: queue.PriorityQueue[tuple[float, int, Job | None]] = queue.PriorityQueue()
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._progress_queue = multiprocessing.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self._progress_queue, frame_cache_size),
+        )
+        self._threads = [threading.Thread(target=self._dispatch, daemon=True) for _ in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._listen_progress, daemon=True))
+
+    def start(self):
+        # Start all worker processes up front, so that the first jobs don't pay for the startup
+        try:
+            for future in [self._pool.submit(_ping) for _ in range(self.workers)]:
+                future.result()
+        except BrokenProcessPool as e:
+            raise DaemonError("worker processes failed to start") from e
+
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        for i in range(self.workers):
+            self._queue.put((-math.inf, -i, None))  # Sorted before any job
+        # Each dispatch thread takes exactly one of the sentinels, after finishing its running job
+        for thread in self._threads[:-1]:
+            if thread.ident is not None:
+                thread.join()
+        self._pool.shutdown()
+        self._progress_queue.put(None)
+
+        # Nothing else takes jobs from the queue now
+        while True:
+            try:
+                job = self._queue.get_nowait()[2]
+            except queue.Empty:
+                break
+            if job is not None:
+                self._update(job, state="cancelled", error="daemon was shut down before the job started")
+
+    def submit(self, input_path, output_path, *, priority: int = 0, options: dict | None = None) -> Job:
+        job_id = next(self._ids)
+        job = Job(id=job_id, input=str(input_path), output=str(output_path), options=options or {}, priority=priority)
+
+        with self._condition:
+            self._jobs[job_id] = job
+        self._queue.put((-priority, job_id, job))
+        return job
+
+    def job(self, job_id: int) -> Job:
+        with self._condition:
+            try:
+                return self._jobs[job_id]
+            except KeyError:
+                raise DaemonError(f"no such job: {job_id}") from None
+
+    def jobs(self) -> list[Job]:
+        with self._condition:
+            return list(self._jobs.values())
+
+    def watch(self, job_id: int):
+        """Yield snapshots of a job's state every time it changes, until the job is finished."""
+        job = self.job(job_id)
+        last = None
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: asdict(job) != last)
+                last = asdict(job)
+            yield {"job": last}
+
+            if job.finished:
+                return
+
+    def _update(self, job: Job, **changes):
+        with self._condition:
+            for key, value in changes.items():
+                setattr(job, key, value)
+            self._condition.notify_all()
+
+    def _dispatch(self):
+        # Only as many jobs as there are workers are passed to the pool, so that the remaining ones stay in the priority
+        # queue and can still be overtaken by jobs with a higher priority.
+        while (job := self._queue.get()[2]) is not None:
+            self._update(job, state="running", started=time.time())
+            try:
+                outputs = self._pool.submit(_run_job, job.id, job.input, job.output, job.options).result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self._update(job, state="failed", error=f"{type(e).__name__}: {e}")
+            else:
+                self._update(job, state="done", outputs=outputs, done=job.total or job.done)
+
+    def _listen_progress(self):
+        while (message := self._progress_queue.get()) is not None:
+            job_id, done, total = message
+            self._update(self._jobs[job_id], done=done, total=total)
+
+    def serve(self, socket_path=None):
+        """Accept requests on a Unix socket until a shutdown request is received."""
+        socket_path = Path(socket_path or default_socket_path())
+
+        if socket_path.exists():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(str(socket_path))
+            except ConnectionRefusedError:
+                socket_path.unlink()  # Left behind by a daemon that did not exit cleanly
+            else:
+                raise DaemonError(f"daemon is already running on {socket_path}")
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                def send(message):
+                    self.wfile.write(json.dumps(message).encode() + b"\n")
+                    self.wfile.flush()
+
+                request = {}
+                try:
+                    request = json.loads(self.rfile.readline())
+                    for response in daemon.handle(request):
+                        send(response)
+                except (DaemonError, ValueError, KeyError, TypeError) as e:
+                    send({"error": str(e)})
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client disconnected, e.g. stopped waiting for a job
+
+                if request.get("command") == "shutdown":
+                    threading.Thread(target=self.server.shutdown).start()
+
+        try:
+            # Closing the server waits for all connections to be handled, so jobs are stopped (and clients waiting on
+            # them are notified) before that.
+            with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as server:
+                try:
+                    self.start()
+                    server.serve_forever()
+                finally:
+                    self.stop()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+    def handle(self, request: dict):
+        """Handle a single request, yielding responses."""
+        command = request.get("command")
+
+        if command == "submit":
+            job = self.submit(
+                request["input"], request["output"], priority=request.get("priority", 0), options=request.get("options")
+            )
+            yield {"job": asdict(job)}
+            if request.get("wait"):
+                yield from self.watch(job.id)
+        elif command == "status":
+            if request.get("job") is not None:
+                yield {"job": asdict(self.job(request["job"]))}
+            else:
+                yield {"jobs": [asdict(job) for job in self.jobs()]}
+        elif command == "wait":
+            yield from self.watch(request["job"])
+        elif command == "shutdown":
+            yield {"state": "shutting down"}
+        else:
+            raise DaemonError(f"unknown command: {command!r}")
+
+
+# Client ===============================================================================================================
+def request(message: dict, *, socket_path=None):
+    """Send a request to the daemon and yield its responses."""
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonError("daemon requires Unix sockets")
+    socket_path = Path(socket_path or default_socket_path())
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonError(f"daemon is not running on {socket_path}") from e
+
+        try:
+            sock.sendall(json.dumps(message).encode() + b"\n")
+
+            with sock.makefile("rb") as stream:
+                for line in stream:
+                    response = json.loads(line)
+                    if "error" in response:
+                        raise DaemonError(response["error"])
+                    yield response
+        except (ConnectionError, json.JSONDecodeError) as e:
+            raise DaemonError(f"lost connection to the daemon: {e}") from e
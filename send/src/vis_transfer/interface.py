@@ -1,10 +1,11 @@
+import functools
 import itertools
 import os
 from datetime import timedelta
 from pathlib import Path
 from queue import Empty as QueueEmpty
 from queue import Queue
-from threading import Thread
+from threading import Event, Thread
 
 from PIL import Image
 from PIL.ImageQt import ImageQt
@@ -12,6 +13,7 @@ from PySide6.QtCore import Qt, QTimer, Signal
 from PySide6.QtGui import QCloseEvent, QPixmap
 from PySide6.QtWidgets import (
     QApplication,
+    QCheckBox,
     QFileDialog,
     QFrame,
     QHBoxLayout,
@@ -25,7 +27,7 @@ from PySide6.QtWidgets import (
 )
 
 from . import constants
-from .core import ddm_stream, ddm_stream_header, packet_count
+from .core import ddm_stream, ddm_stream_header, ddm_tail_stream, packet_count
 
 
 class TransferWindow(QWidget):
@@ -33,23 +35,39 @@ class TransferWindow(QWidget):
     imageSwitched = Signal(int)
 
     class GeneratorThread(Thread):
-        """A thread that generates new images in background an places them into a queue."""
+        """A thread that generates new images in background an places them into a queue.
+
+        In tail mode, images are generated as the file grows, until `finish` is called.
+        """
 
         ImageBufferSize = 2
 
-        def __init__(self, fd, target_size):
+        def __init__(self, fd, target_size, *, tail=False):
             super().__init__()
             self.fd = fd
             self.target_size = target_size
+            self.tail = tail
             self.queue = Queue(maxsize=self.ImageBufferSize or 0)
 
             self.abort_flag = False
+            self.finish_event = Event()
 
         def run(self):
             def push(index, image):
                 image = QPixmap(ImageQt(image.resize((self.target_size, self.target_size), Image.Resampling.NEAREST)))
                 self.queue.put((index, image))
 
+            if self.tail:
+                # Checkpoints are interleaved with data, so every image is counted as a frame
+                images = ddm_tail_stream(self.fd, symbol_size=constants.DatamatrixWidth, stop=self.finish_event)
+                for i, image in enumerate(images):
+                    if self.abort_flag:
+                        return
+                    push(i, image)
+
+                self.queue.put(None)
+                return
+
             push(constants.HeaderPacketIndex, ddm_stream_header(self.fd, symbol_size=constants.DatamatrixWidth))
 
             for i, image in zip(itertools.count(), ddm_stream(self.fd, symbol_size=constants.DatamatrixWidth)):
@@ -59,8 +77,13 @@ class TransferWindow(QWidget):
 
             self.queue.put(None)
 
+        def finish(self):
+            """In tail mode, stop waiting for the file to grow and send the rest of it."""
+            self.finish_event.set()
+
         def abort(self):
             self.abort_flag = True
+            self.finish_event.set()  # Stop waiting for the file to grow
             # Discard all items from the queue so that the thread unblocks and notices the abort flag
             try:
                 while self.is_alive():
@@ -70,12 +93,13 @@ class TransferWindow(QWidget):
 
             self.join()
 
-    def __init__(self, fd, *, fps=15):
+    def __init__(self, fd, *, fps=15, tail=False):
         super().__init__()
 
         self.fd = fd
+        self.tail = tail
         self.target_image_size = self.get_target_size()
-        self.packet_count = packet_count(self.fd)
+        self.packet_count = None if tail else packet_count(self.fd)  # Not known in advance in tail mode
 
         self.seconds_per_frame = None
         self.fps = fps
@@ -94,29 +118,45 @@ class TransferWindow(QWidget):
         self.wImage.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Ignored)
 
         # Control widget -----------------------------------------------------------------------------------------------
-        est_time_string = str(timedelta(seconds=round(self.estimated_time)))
-
         wControlWidgetFrame = QFrame()
         wControlWidgetFrame.setFrameShape(QFrame.Shape.Box)
-        wGeneralInfo = QLabel(
-            'Begin filming the screen, then press "Start".\n'
-            f"Estimated transfer time: {est_time_string}.\n"
-            'Press "Abort" at any time to close the window.'
-        )
-        wGeneralInfo.setWordWrap(True)
 
         self.wProgressBar = QProgressBar()
         self.wProgressBar.setMinimum(0)
-        self.wProgressBar.setMaximum(self.packet_count)
         self.wProgressBar.setTextVisible(False)
-        self.wProgressInfo = QLabel(f"-/{self.packet_count}; {est_time_string}")
         self.wStartPauseButton = QPushButton("Start")
         self.wStartPauseButton.clicked.connect(self.start)
+        self.wFinishButton = QPushButton("Finish")
+        self.wFinishButton.clicked.connect(self.finish)
+        self.wFinishButton.setVisible(tail)
         self.wAbortButton = QPushButton("Abort")
         self.wAbortButton.clicked.connect(self.close)
         self.wAbortButton.setStyleSheet("background-color:red;")
 
+        if tail:
+            wGeneralInfo = QLabel(
+                'Begin filming the screen, then press "Start".\n'
+                'The file is sent as it grows. Press "Finish" once it is complete to send the rest of it.\n'
+                'Press "Abort" at any time to close the window.'
+            )
+            self.wProgressBar.setMaximum(0)  # Busy indicator, total is unknown
+            self.wProgressInfo = QLabel("0 frames")
+        else:
+            est_time_string = str(timedelta(seconds=round(self.estimated_time)))
+            wGeneralInfo = QLabel(
+                'Begin filming the screen, then press "Start".\n'
+                f"Estimated transfer time: {est_time_string}.\n"
+                'Press "Abort" at any time to close the window.'
+            )
+            self.wProgressBar.setMaximum(self.packet_count)
+            self.wProgressInfo = QLabel(f"-/{self.packet_count}; {est_time_string}")
+        wGeneralInfo.setWordWrap(True)
+
         def updateProgress(index):
+            if self.tail:
+                self.wProgressInfo.setText(f"{index+1} frames")
+                return
+
             self.wProgressBar.setValue(index + 1)
 
             remaining_time = round((self.packet_count - index - 1) * self.seconds_per_frame)
@@ -129,6 +169,7 @@ class TransferWindow(QWidget):
         lyButtonArea.addWidget(self.wProgressBar)
         lyButtonArea.addWidget(self.wProgressInfo)
         lyButtonArea.addWidget(self.wStartPauseButton)
+        lyButtonArea.addWidget(self.wFinishButton)
         lyButtonArea.addWidget(self.wAbortButton)
 
         lyControlWidgetFrameHolder = QVBoxLayout()
@@ -148,13 +189,14 @@ class TransferWindow(QWidget):
         ly.addStretch(1)
 
         # ==============================================================================================================
-        self.generator_thread = self.GeneratorThread(self.fd, self.target_image_size)
+        self.generator_thread = self.GeneratorThread(self.fd, self.target_image_size, tail=tail)
         self.image_queue = self.generator_thread.queue
 
         self.generator_thread.start()
 
         self.timer = QTimer()
-        self.timer.timeout.connect(self._switchImage)
+        # In tail mode, new images may not appear for a while; the last one stays on screen instead of blocking the UI
+        self.timer.timeout.connect(functools.partial(self._switchImage, wait=not tail))
         self._switchImage()
 
     @classmethod
@@ -189,14 +231,21 @@ class TransferWindow(QWidget):
 
         self.wStartPauseButton.setEnabled(False)
 
+    def finish(self):
+        self.generator_thread.finish()
+        self.wFinishButton.setEnabled(False)
+
     def abort(self):
         self.timer.stop()
         self.generator_thread.abort()
         self.stopped.emit(True)
         self.close()
 
-    def _switchImage(self):
-        queue_item: tuple[int, QPixmap] | None = self.image_queue.get()
+    def _switchImage(self, *, wait=True):
+        try:
+            queue_item: tuple[int, QPixmap] | None = self.image_queue.get(block=wait)
+        except QueueEmpty:
+            return
         if queue_item is None:
             self.timer.stop()
             self.generator_thread.join()
@@ -248,6 +297,8 @@ class SetupWindow(QWidget):
         lyFile.addWidget(self.wFileSelectButton)
         lyFile.addWidget(self.wFileName)
 
+        self.wTailCheckBox = QCheckBox("Keep sending while the file grows")
+
         # Start button -------------------------------------------------------------------------------------------------
         lyControlArea = QHBoxLayout()
         lyControlArea.setContentsMargins(0, 0, 0, 0)
@@ -288,6 +339,7 @@ class SetupWindow(QWidget):
 
         ly.addWidget(wWelcomeText)
         ly.addLayout(lyFile)
+        ly.addWidget(self.wTailCheckBox)
         ly.addSpacing(30)
         ly.addStretch()
         ly.addWidget(separator)
@@ -313,16 +365,22 @@ class SetupWindow(QWidget):
     def beginTransfer(self):
         assert self.payloadPath is not None
         self.fd = open(self.payloadPath, "rb")
+        tail = self.wTailCheckBox.isChecked()
 
-        packet_count_ = packet_count(self.fd)  # No touching fd after TransferWindow has been created!
+        # No touching fd after TransferWindow has been created!
+        packet_count_ = None if tail else packet_count(self.fd)
 
-        self.wTransferWindow = TransferWindow(self.fd)
+        self.wTransferWindow = TransferWindow(self.fd, tail=tail)
         self.wTransferWindow.stopped.connect(self.onStopTransfer)
 
         self.wProgressBar.setMinimum(0)
-        self.wProgressBar.setMaximum(packet_count_)
+        self.wProgressBar.setMaximum(packet_count_ or 0)
 
         def updateProgress(i):
+            if packet_count_ is None:
+                self.wProgressText.setText(f"{i+1} frames")
+                return
+
             self.wProgressBar.setValue(i + 1)
             self.wProgressText.setText(f"{i+1}/{packet_count_}")
 
@@ -341,6 +399,8 @@ class SetupWindow(QWidget):
         self.wTransferWindow = None
         self.fd.close()
         self.lyControlButtons.setCurrentWidget(self.wStartButton)
+        if self.wProgressBar.maximum() == 0:  # Busy indicator of a tail transfer
+            self.wProgressBar.setMaximum(1)
 
         if is_aborted:
             self.wProgressText.setText("Aborted")
@@ -0,0 +1,157 @@
+"""Writing transfers into video files. Requires the `video` extra (PyAV)."""
+
+import functools
+import itertools
+import math
+from pathlib import Path
+
+try:
+    import av
+except ImportError as e:
+    raise ImportError('generating videos requires PyAV, install it with: pip install "vis-transfer[video]"') from e
+
+from .constants import DatamatrixWidth, dminfo
+from .core import (
+    dense_datamatrix,
+    packet_stream,
+    packet_stream_header,
+    packet_stream_info,
+    segment_header,
+    segment_packet_stream,
+    segmented_stream_info,
+    tail_packet_stream,
+)
+
+
+def write_video(images, /, *, output_path, progress=None):
+    """Write an iterable of images into a lossless video file, one image per frame. Return the number of frames.
+
+    If specified, `progress` is called with the number of frames written so far after every frame.
+    """
+    images = iter(images)
+    first = next(images)
+
+    with av.open(output_path, mode="w") as container:
+        stream = container.add_stream("vp9", rate=1, options={"lossless": "1"})
+        stream.pix_fmt = "gbrp"
+        stream.width = first.size[0]
+        stream.height = first.size[1]
+
+        count = 0
+        for count, image in enumerate(itertools.chain([first], images), start=1):
+            frame = av.VideoFrame.from_image(image)
+            for packet in stream.encode(frame):
+                container.mux_one(packet)
+
+            if progress is not None:
+                progress(count)
+
+        for packet in stream.encode():
+            container.mux_one(packet)
+
+    return count
+
+
+def _render_function(render, symbol_size):
+    """Return `render` or, if it's None, a function that renders a packet as a dense datamatrix."""
+    return render or functools.partial(dense_datamatrix, symbol_size=symbol_size)
+
+
+def _frame_count(length, packet_size):
+    """Number of frames in a video of a stream of `length` bytes, including the header."""
+    return math.ceil(length / (packet_size - 6)) + 1
+
+
+def generate_video(fd, /, *, output_path, symbol_size=DatamatrixWidth, file_info=None, render=None, progress=None):
+    """Generate a video of a file.
+
+    `file_info` is the file's PacketStreamInfo, computed from `fd` if not specified. `render` turns a packet into an
+    image, by default a dense datamatrix. `progress` is called with the number of frames written and the total number
+    of frames after every frame.
+    """
+    packet_size = dminfo[symbol_size].eci_bytes * 3
+    render = _render_function(render, symbol_size)
+    if file_info is None:
+        file_info = packet_stream_info(fd)
+
+    total = _frame_count(file_info.file_size, packet_size)
+    packets = itertools.chain(
+        [packet_stream_header(file_info, packet_size)],
+        packet_stream(fd, packet_size=packet_size),
+    )
+    write_video(
+        map(render, packets),
+        output_path=output_path,
+        progress=(lambda done: progress(done, total)) if progress is not None else None,
+    )
+
+
+def generate_tail_video(fd, /, *, output_path, symbol_size=DatamatrixWidth, render=None, progress=None, **kwargs):
+    """Generate a live-tail video of a file that may still be growing. Keyword arguments go to `tail_packet_stream`.
+
+    `render` and `progress` are the same as in `generate_video`; the total number of frames passed to `progress` is
+    always None.
+    """
+    packet_size = dminfo[symbol_size].eci_bytes * 3
+    render = _render_function(render, symbol_size)
+
+    packets = tail_packet_stream(fd, packet_size=packet_size, **kwargs)
+    write_video(
+        map(render, packets),
+        output_path=output_path,
+        progress=(lambda done: progress(done, None)) if progress is not None else None,
+    )
+
+
+def segment_output_path(output_path, segment_index, segment_count):
+    """Produce a path for a segment video by inserting a zero-padded segment index before the file extension."""
+    output_path = Path(output_path)
+    width = len(str(segment_count - 1))
+    return output_path.with_name(f"{output_path.stem}.{segment_index:0{width}}{output_path.suffix}")
+
+
+def generate_segmented_videos(
+    fd,
+    /,
+    *,
+    output_path,
+    segment_size=None,
+    symbol_size=DatamatrixWidth,
+    session_id=None,
+    stream_info=None,
+    render=None,
+    progress=None,
+):
+    """Generate one video per segment of the file. Return a list of generated video paths.
+
+    `stream_info` is the file's SegmentedStreamInfo. If not specified, it is computed from `fd`, `segment_size` and
+    `session_id`. `render` and `progress` are the same as in `generate_video`, with progress counted over all segments.
+    """
+    packet_size = dminfo[symbol_size].eci_bytes * 3
+    render = _render_function(render, symbol_size)
+    if stream_info is None:
+        stream_info = segmented_stream_info(fd, segment_size=segment_size, session_id=session_id)
+
+    segment_count = len(stream_info.segments)
+    total = sum(_frame_count(segment.length, packet_size) for segment in stream_info.segments)
+    done_before = 0
+    result = []
+
+    for i, segment in enumerate(stream_info.segments):
+        path = segment_output_path(output_path, i, segment_count)
+        packets = itertools.chain(
+            [segment_header(stream_info, i, packet_size=packet_size)],
+            segment_packet_stream(fd, segment, packet_size=packet_size),
+        )
+
+        def segment_progress(done, offset=done_before):
+            progress(offset + done, total)
+
+        done_before += write_video(
+            map(render, packets),
+            output_path=path,
+            progress=segment_progress if progress is not None else None,
+        )
+        result.append(path)
+
+    return result
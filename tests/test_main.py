@@ -2,17 +2,22 @@ from pathlib import Path
 import pytest
 import platform
 import subprocess as sp
+import threading
+import time
 
 thisdir = Path(__file__).parent
 datadir = thisdir / "data"
 tempdir = thisdir / ".temp"
 
-def decode(path, output_path):
+def decode(paths, output_path):
     exe = "recv/dist/bin/vis-recv"
     if platform.system() == "Windows":
         exe += ".exe"
 
-    sp.run([exe, str(path), "-fo", str(output_path)], check=True)
+    if isinstance(paths, Path):
+        paths = [paths]
+
+    sp.run([exe, *(str(path) for path in paths), "-fo", str(output_path)], check=True)
 
 def compare(fd1, fd2):
     index = 0
@@ -68,7 +73,7 @@ def test_decode(path):
 
 @pytest.mark.parametrize("path", (datadir / "roundtrip").glob("*"))
 def test_roundrip(path):
-    from vis_transfer.testing import generate_video
+    from vis_transfer.video import generate_video
     tempdir.mkdir(exist_ok=True)
 
     video_path = tempdir / f"{path.name}.mkv"
@@ -79,3 +84,213 @@ def test_roundrip(path):
 
     decode(video_path, decoded_path)
     assert_file_equivalence(path, decoded_path, f"Roundtrip for {path.name} has failed.")
+
+
+@pytest.mark.parametrize("path", (datadir / "roundtrip").glob("*"))
+def test_roundrip_segmented(path):
+    from vis_transfer.video import generate_segmented_videos
+    tempdir.mkdir(exist_ok=True)
+
+    video_path = tempdir / f"{path.name}.segmented.mkv"
+    decoded_path = tempdir / f"decoded-segmented-{path.name}"
+
+    with open(path, "rb") as fd:
+        video_paths = generate_segmented_videos(fd, output_path=video_path, segment_size=16384)
+
+    decode(video_paths, decoded_path)
+    assert_file_equivalence(path, decoded_path, f"Segmented roundtrip for {path.name} has failed.")
+
+
+@pytest.mark.parametrize("path", (datadir / "roundtrip").glob("*"))
+def test_roundrip_tail(path):
+    from vis_transfer.video import generate_tail_video
+    tempdir.mkdir(exist_ok=True)
+
+    video_path = tempdir / f"{path.name}.tail.mkv"
+    decoded_path = tempdir / f"decoded-tail-{path.name}"
+
+    with open(path, "rb") as fd:
+        generate_tail_video(fd, output_path=video_path, idle_timeout=0, checkpoint_interval=4)
+
+    decode(video_path, decoded_path)
+    assert_file_equivalence(path, decoded_path, f"Tail roundtrip for {path.name} has failed.")
+
+
+@pytest.mark.parametrize("path", (datadir / "roundtrip").glob("*"))
+def test_roundrip_tail_growing(path):
+    from vis_transfer.video import generate_tail_video
+    tempdir.mkdir(exist_ok=True)
+
+    growing_path = tempdir / f"growing-{path.name}"
+    video_path = tempdir / f"{path.name}.tail-growing.mkv"
+    decoded_path = tempdir / f"decoded-tail-growing-{path.name}"
+
+    stop = threading.Event()
+
+    def grow():
+        with open(path, "rb") as src, open(growing_path, "ab") as dst:
+            while chunk := src.read(3000):
+                dst.write(chunk)
+                dst.flush()
+                time.sleep(0.05)
+        stop.set()
+
+    growing_path.write_bytes(b"")
+    writer = threading.Thread(target=grow)
+    writer.start()
+
+    with open(growing_path, "rb") as fd:
+        generate_tail_video(fd, output_path=video_path, poll_interval=0.01, checkpoint_interval=2, stop=stop)
+    writer.join()
+
+    decode(video_path, decoded_path)
+    assert_file_equivalence(path, decoded_path, f"Growing tail roundtrip for {path.name} has failed.")
+
+
+def test_tail_truncated_recording():
+    from vis_transfer.constants import DatamatrixWidth
+    from vis_transfer.core import ddm_tail_stream
+    from vis_transfer.video import write_video
+    tempdir.mkdir(exist_ok=True)
+
+    path = datadir / "roundtrip" / "random-100K.bin"
+    video_path = tempdir / "truncated.tail.mkv"
+    decoded_path = tempdir / "decoded-truncated-tail"
+    incomplete_path = tempdir / "decoded-truncated-tail.vis-transfer-incomplete"
+    incomplete_path.unlink(missing_ok=True)
+
+    with open(path, "rb") as fd:
+        images = list(ddm_tail_stream(fd, symbol_size=DatamatrixWidth, idle_timeout=0, checkpoint_interval=4))
+    write_video(images[:-3], output_path=video_path)  # Cut off the final checkpoint and the last data packets
+
+    with pytest.raises(sp.CalledProcessError):
+        decode(video_path, decoded_path)
+
+    assert not decoded_path.exists()
+    prefix = incomplete_path.read_bytes()
+    assert 0 < len(prefix) < path.stat().st_size
+    assert path.read_bytes().startswith(prefix)
+
+
+def test_tail_recording_with_gap():
+    from vis_transfer.constants import DatamatrixWidth
+    from vis_transfer.core import ddm_tail_stream
+    from vis_transfer.video import write_video
+    tempdir.mkdir(exist_ok=True)
+
+    path = datadir / "roundtrip" / "random-100K.bin"
+    video_path = tempdir / "gap.tail.mkv"
+    decoded_path = tempdir / "decoded-gap-tail"
+    incomplete_path = tempdir / "decoded-gap-tail.vis-transfer-incomplete"
+    incomplete_path.unlink(missing_ok=True)
+
+    with open(path, "rb") as fd:
+        images = list(ddm_tail_stream(fd, symbol_size=DatamatrixWidth, idle_timeout=0, checkpoint_interval=4))
+    middle = len(images) // 2
+    write_video(images[:middle] + images[middle + 1 :], output_path=video_path)  # Lose a frame in the middle
+
+    with pytest.raises(sp.CalledProcessError):
+        decode(video_path, decoded_path)
+
+    # Everything verified before the gap is kept
+    assert not decoded_path.exists()
+    prefix = incomplete_path.read_bytes()
+    assert 0 < len(prefix) < path.stat().st_size
+    assert path.read_bytes().startswith(prefix)
+
+
+def test_tail_truncated_file():
+    from vis_transfer import constants
+    from vis_transfer.core import tail_packet_stream
+    tempdir.mkdir(exist_ok=True)
+
+    path = tempdir / "truncated-while-sending.bin"
+    path.write_bytes(bytes(constants.BlockSize * 3))
+
+    with open(path, "rb") as fd:
+        packets = tail_packet_stream(fd, packet_size=constants.PacketSize, poll_interval=0.01)
+        for _ in range(5):  # Initial checkpoint, 3 data packets, checkpoint after catching up
+            next(packets)
+
+        with open(path, "r+b") as writer:
+            writer.truncate(constants.BlockSize)
+
+        with pytest.raises(ValueError, match="truncated"):
+            next(packets)
+
+
+def test_roundtrip_daemon():
+    from vis_transfer.daemon import Daemon
+    tempdir.mkdir(exist_ok=True)
+
+    paths = list((datadir / "roundtrip").glob("*"))
+    daemon = Daemon(workers=2)
+    daemon.start()
+
+    try:
+        jobs = [daemon.submit(path, tempdir / f"{path.name}.daemon.mkv", priority=i) for i, path in enumerate(paths)]
+        for job in jobs:
+            for _ in daemon.watch(job.id):
+                pass
+            assert job.state == "done", job.error
+    finally:
+        daemon.stop()
+
+    for path, job in zip(paths, jobs):
+        decoded_path = tempdir / f"decoded-daemon-{path.name}"
+        decode(Path(job.outputs[0]), decoded_path)
+        assert_file_equivalence(path, decoded_path, f"Daemon roundtrip for {path.name} has failed.")
+
+
+def test_daemon_protocol():
+    from vis_transfer.daemon import Daemon, request
+    tempdir.mkdir(exist_ok=True)
+
+    path = datadir / "roundtrip" / "text-10K.txt"
+    socket_path = tempdir / "daemon.sock"
+    socket_path.unlink(missing_ok=True)
+
+    daemon = Daemon(workers=1)
+    server = threading.Thread(target=daemon.serve, args=(socket_path,))
+    server.start()
+    while not socket_path.exists():
+        time.sleep(0.01)
+
+    def submit(name, priority=0, **options):
+        message = {
+            "command": "submit",
+            "input": str(path),
+            "output": str(tempdir / f"daemon-{name}.mkv"),
+            "priority": priority,
+            "options": options,
+        }
+        return next(request(message, socket_path=socket_path))["job"]
+
+    def wait(job):
+        *_, last = request({"command": "wait", "job": job["id"]}, socket_path=socket_path)
+        return last["job"]
+
+    # The only worker is occupied by a tail job until it times out, so the jobs below are queued
+    blocker = submit("blocker", tail=True, idle_timeout=2)
+    low = submit("low", priority=1)
+    high = submit("high", priority=2)
+
+    for job in (blocker, low, high):
+        assert wait(job)["state"] == "done"
+
+    jobs = {job["id"]: job for job in next(request({"command": "status"}, socket_path=socket_path))["jobs"]}
+    assert jobs[high["id"]]["started"] < jobs[low["id"]]["started"]
+    assert Path(jobs[low["id"]]["outputs"][0]).exists()
+
+    # Shutting down finishes the running job and cancels the queued one, notifying clients waiting on it
+    blocker = submit("blocker-2", tail=True, idle_timeout=2)
+    queued = submit("queued")
+    waiter = request({"command": "wait", "job": queued["id"]}, socket_path=socket_path)
+    assert next(waiter)["job"]["state"] == "queued"
+
+    list(request({"command": "shutdown"}, socket_path=socket_path))
+    *_, last = waiter
+    assert last["job"]["state"] == "cancelled"
+
+    server.join()
+    assert not socket_path.exists()